@@ -1,26 +1,122 @@
-from copy import deepcopy
+import time
+
+from game_engine import CELL_MOVES, PLAYER_INDEX, WINNING_CELLS
+from transposition import (EXACT, INVERSE_SYMMETRIES, LOWER, SYMMETRIES, UPPER,
+                           canonical_key)
+
+# Center first, then corners, then edges.
+CELL_PRIORITY = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+
+
+class SearchBudget:
+    # Wall-clock and node limits for one search. Once spent, every node
+    # returns at once and the unfinished iteration is thrown away.
+    CHECK_EVERY = 256
+
+    def __init__(self, time_limit=None, node_limit=None):
+        self.deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self.node_limit = node_limit
+        self.nodes = 0
+        self.stopped = False
+
+    def spend(self):
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            self.stopped = True
+        elif (self.deadline is not None and self.nodes % self.CHECK_EVERY == 0
+              and time.perf_counter() >= self.deadline):
+            self.stopped = True
+        return self.stopped
+
 
 class AIPlayer:
-    def __init__(self, player_symbol):
+    def __init__(self, player_symbol, max_depth=3, pruning=True, table=None,
+                 solution=None, time_limit=None, node_limit=None):
         self.player = player_symbol
         self.opponent = "O" if player_symbol == "X" else "X"
+        self.index = PLAYER_INDEX[self.player]
+        self.opponent_index = PLAYER_INDEX[self.opponent]
+        self.max_depth = max_depth
+        self.pruning = pruning
+        self.table = table  # Optional TranspositionTable, kept across calls
+        self.solution = solution  # Optional solver.Solution for perfect play
+        # With a time (seconds) or node limit, search deepens one ply at a
+        # time up to max_depth and keeps the move of the last full iteration.
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.searches = 0
+        self.nodes_searched = 0
+        self.last_nodes = 0
 
+    # The search plays moves on game_state and undoes them on the way back,
+    # so the caller's game is left exactly as it was passed in.
     def get_best_move(self, game_state):
+        # A solved position is a single lookup; search only covers positions
+        # outside the table, e.g. when both sides were not alternating.
+        if self.solution is not None and not game_state.is_game_over():
+            move = self.solution.best_move(game_state, self.index)
+            if move is not None:
+                return move
+
+        budget = SearchBudget(self.time_limit, self.node_limit)
+        if self.time_limit is None and self.node_limit is None:
+            best_move = self.search_root(game_state, self.max_depth, budget)
+        else:
+            cells = game_state.valid_cells()
+            best_move = CELL_MOVES[cells[0]] if cells else None
+            for depth in range(1, self.max_depth + 1):
+                move = self.search_root(game_state, depth, budget, best_move)
+                if budget.stopped:
+                    break
+                best_move = move
+
+        self.searches += 1
+        self.nodes_searched += budget.nodes
+        self.last_nodes = budget.nodes
+        return best_move
+
+    def search_root(self, game_state, max_depth, budget, first_move=None):
         best_score = float('-inf')
         best_move = None
+        alpha = float('-inf')
 
-        for move in game_state.get_valid_moves():
-            game_copy = deepcopy(game_state)
-            game_copy.make_move(move[0], move[1], self.player)
-            score = self.minimax(game_copy, False, depth=1)
+        cells = self.candidate_moves(game_state, self.index)
+        if self.table is not None and cells:
+            key, transform = canonical_key(game_state, self.index)
+            entry = self.table.probe(key)
+            if entry is not None:
+                entry_depth, bound, _, move = entry
+                cell = INVERSE_SYMMETRIES[transform][move]
+                if entry_depth >= max_depth and bound == EXACT:
+                    return CELL_MOVES[cell]
+                cells = move_first(cells, cell)
+        if first_move is not None:
+            cells = move_first(cells, first_move[0] * 3 + first_move[1])
+
+        for cell in cells:
+            game_state.place(cell, self.index)
+            score = self.minimax(game_state, False, 1, max_depth, alpha, float('inf'), budget)
+            game_state.unmake_move()
+            if budget.stopped:
+                return best_move
 
             if score > best_score:
                 best_score = score
-                best_move = move
+                best_move = CELL_MOVES[cell]
+                if self.pruning:
+                    alpha = best_score
 
+        if self.table is not None and best_move is not None:
+            cell = best_move[0] * 3 + best_move[1]
+            self.table.store(key, max_depth, EXACT, best_score,
+                             SYMMETRIES[transform][cell])
         return best_move
 
-    def minimax(self, game_state, is_maximizing, depth=0, max_depth=3):
+    def minimax(self, game_state, is_maximizing, depth=0, max_depth=3,
+                alpha=float('-inf'), beta=float('inf'), budget=None):
+        if budget is not None and budget.spend():
+            return 0
+
         if game_state.is_game_over():
             if game_state.winner == self.player:
                 return 1
@@ -31,28 +127,97 @@ class AIPlayer:
         if depth == max_depth:
             return self.evaluate(game_state)
 
+        p = self.index if is_maximizing else self.opponent_index
+        cells = self.candidate_moves(game_state, p)
+        remaining = max_depth - depth
+        table = self.table
+        if table is not None:
+            # Table scores are seen by the side to move; flip them for the
+            # minimizing side so the table can be shared by both players.
+            sign = 1 if is_maximizing else -1
+            key, transform = canonical_key(game_state, p)
+            entry = table.probe(key)
+            if entry is not None:
+                entry_depth, bound, score, move = entry
+                score *= sign
+                if sign < 0 and bound != EXACT:
+                    bound = LOWER if bound == UPPER else UPPER
+                if entry_depth >= remaining:
+                    if (bound == EXACT or (bound == LOWER and score >= beta)
+                            or (bound == UPPER and score <= alpha)):
+                        return score
+                cells = move_first(cells, INVERSE_SYMMETRIES[transform][move])
+            alpha_start = alpha
+            beta_start = beta
+
         best_score = float('-inf') if is_maximizing else float('inf')
-        for move in game_state.get_valid_moves():
-            game_copy = deepcopy(game_state)
-            game_copy.make_move(move[0], move[1],
-                                self.player if is_maximizing else self.opponent)
-            score = self.minimax(game_copy, not is_maximizing, depth + 1, max_depth)
+        best_cell = cells[0]
+        for cell in cells:
+            game_state.place(cell, p)
+            score = self.minimax(game_state, not is_maximizing, depth + 1, max_depth, alpha, beta, budget)
+            game_state.unmake_move()
+            if budget is not None and budget.stopped:
+                return 0
 
             if is_maximizing:
-                best_score = max(best_score, score)
+                if score > best_score:
+                    best_score = score
+                    best_cell = cell
+                    if self.pruning and best_score > alpha:
+                        alpha = best_score
+            elif score < best_score:
+                best_score = score
+                best_cell = cell
+                if self.pruning and best_score < beta:
+                    beta = best_score
+
+            if alpha >= beta:
+                break
+
+        if table is not None:
+            if best_score <= alpha_start:
+                bound = UPPER
+            elif best_score >= beta_start:
+                bound = LOWER
             else:
-                best_score = min(best_score, score)
+                bound = EXACT
+            if sign < 0 and bound != EXACT:
+                bound = LOWER if bound == UPPER else UPPER
+            table.store(key, remaining, bound, best_score * sign,
+                        SYMMETRIES[transform][best_cell])
 
         return best_score
 
+    def candidate_moves(self, game_state, p):
+        if not self.pruning:
+            return game_state.valid_cells()
+        return order_moves(game_state, p)
+
     def evaluate(self, game_state):
-        board = game_state.get_visible_board()
-        score = 0
-        for row in board:
-            for cell in row:
-                if cell:
-                    if cell[0] == self.player:
-                        score += 1
-                    elif cell[0] == self.opponent:
-                        score -= 1
-        return score
+        return game_state.masks[self.index].bit_count() - game_state.masks[self.opponent_index].bit_count()
+
+
+def move_first(cells, first):
+    if first not in cells:
+        return cells
+    return [first] + [cell for cell in cells if cell != first]
+
+
+def order_moves(game_state, p):
+    # Winning moves, then blocks of the opponent's next win, then by square.
+    valid = game_state.valid_cells()
+    own = WINNING_CELLS[game_state.mask_after_move(p)]
+    other = WINNING_CELLS[game_state.mask_after_move(1 - p)]
+    wins = []
+    blocks = []
+    rest = []
+    for cell in CELL_PRIORITY:
+        if cell not in valid:
+            continue
+        if own >> cell & 1:
+            wins.append(cell)
+        elif other >> cell & 1:
+            blocks.append(cell)
+        else:
+            rest.append(cell)
+    return wins + blocks + rest
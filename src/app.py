@@ -1,10 +1,41 @@
+import os
+
 from flask import Flask, render_template, request, jsonify
-from game_engine import DisappearingTicTacToe
 from ai_player import AIPlayer
+from game_store import is_valid_game_id, new_game_id, store_from_url
+from mcts_player import MCTSPlayer
+from search_pool import SearchPool, SearchPoolFull
+from solver import DEFAULT_PATH, Solution
+from transposition import TranspositionTable
 
 app = Flask(__name__, static_url_path="/static")
-game = DisappearingTicTacToe()
-ai = AIPlayer("O")
+# Each browser plays its own game, keyed by the game_id cookie. Use
+# GAME_STORE=file:<dir> or sqlite:<path> to share games between workers.
+store = store_from_url(os.environ.get("GAME_STORE", "memory"),
+                       ttl=int(os.environ.get("GAME_TTL", 3600)))
+# Run `python solver.py` once to create the table for perfect play.
+SOLUTION_PATH = os.environ.get("AI_SOLUTION", DEFAULT_PATH)
+solution = Solution(SOLUTION_PATH) if os.path.exists(SOLUTION_PATH) else None
+# Without a solution the AI deepens its search until AI_TIME_LIMIT seconds
+# have passed and plays the best move found so far. AI_ENGINE=mcts swaps in
+# Monte Carlo Tree Search, capped at AI_ITERATIONS playouts per move.
+AI_ENGINE = os.environ.get("AI_ENGINE", "minimax")
+AI_TIME_LIMIT = float(os.environ.get("AI_TIME_LIMIT", 0.25))
+if AI_ENGINE not in ("minimax", "mcts"):
+    raise ValueError(f"Unknown AI_ENGINE: {AI_ENGINE!r}")
+if AI_ENGINE == "mcts":
+    ai = MCTSPlayer("O", iterations=int(os.environ.get("AI_ITERATIONS", 2000)),
+                    time_limit=AI_TIME_LIMIT)
+else:
+    ai = AIPlayer("O", max_depth=int(os.environ.get("AI_MAX_DEPTH", 6)),
+                  time_limit=AI_TIME_LIMIT, table=TranspositionTable(), solution=solution)
+# /move_async searches here instead of in the request thread.
+search_pool = SearchPool(max_workers=int(os.environ.get("AI_WORKERS", 2)),
+                         max_pending=int(os.environ.get("AI_MAX_PENDING", 32)))
+pending_moves = {}  # game_id -> (future, turn the search started from)
+# Seconds a client is told to wait when the pool is full and /ai_move
+# answers 503.
+AI_RETRY_AFTER = int(os.environ.get("AI_RETRY_AFTER", 1))
 
 HUMAN_PLAYER = "X"
 AI_PLAYER = "O"
@@ -13,44 +44,145 @@ AI_PLAYER = "O"
 def index():
     return render_template("index.html")
 
+def current_game_id(data=None):
+    game_id = (data or {}).get("game_id") or request.cookies.get("game_id")
+    return game_id if is_valid_game_id(game_id) else new_game_id()
+
+def respond(game_id, payload, status=200, headers=None):
+    response = jsonify(dict(payload, game_id=game_id))
+    response.set_cookie("game_id", game_id, max_age=store.ttl, samesite="Lax")
+    if headers:
+        response.headers.update(headers)
+    return response, status
+
 @app.route("/reset", methods=["POST"])
 def reset():
-    game.reset_game()
-    return jsonify({"status": "Game reset."})
+    game_id = current_game_id(request.get_json(silent=True))
+    with store.session(game_id) as game:
+        game.reset_game()
+        pending_moves.pop(game_id, None)
+    return respond(game_id, {"status": "Game reset."})
+
+@app.route("/stats")
+def stats():
+    table = getattr(ai, "table", None)
+    return jsonify({"engine": AI_ENGINE,
+                    "transposition_table": table.stats() if table else None,
+                    "games": store.stats(),
+                    "search_pool": search_pool.stats()})
+
+def ai_waiting(game):
+    # X moves on even turns, so an odd turn means the AI still owes a reply.
+    return not game.is_game_over() and game.current_turn % 2 == 1
+
+def board_payload(game):
+    return {
+        "board": convert_board_to_json_compatible(game.get_visible_board()),
+        "winner": game.winner,
+        "turn": game.current_turn,
+        "message": f"{game.winner} wins!" if game.winner else ""
+    }
 
 @app.route("/move", methods=["POST"])
 def handle_move():
     data = request.get_json()
     row = int(data["row"])
     col = int(data["col"])
+    game_id = current_game_id(data)
 
-    if game.is_game_over():
-        return jsonify({"error": "Game is already over."}), 400
+    with store.session(game_id) as game:
+        if game.is_game_over():
+            return respond(game_id, {"error": "Game is already over."}, 400)
+        if ai_waiting(game):
+            return respond(game_id, {"error": "Waiting for the AI move."}, 409)
 
-    print(f"Human attempted move at: ({row}, {col})")
+        print(f"Human attempted move at: ({row}, {col})")
 
-    move_successful = game.make_move(row, col, HUMAN_PLAYER)
-    if not move_successful:
-        return jsonify({"error": "Invalid move."}), 400
+        move_successful = game.make_move(row, col, HUMAN_PLAYER)
+        if not move_successful:
+            return respond(game_id, {"error": "Invalid move."}, 400)
 
-    if not game.is_game_over():
-        ai_move = ai.get_best_move(game)
-        if ai_move:
-            print(f"AI plays at: {ai_move}")
-            game.make_move(ai_move[0], ai_move[1], AI_PLAYER)
+        if not game.is_game_over():
+            ai_move = ai.get_best_move(game)
+            if ai_move:
+                print(f"AI plays at: {ai_move}")
+                game.make_move(ai_move[0], ai_move[1], AI_PLAYER)
 
-    response = {
-        "board": convert_board_to_json_compatible(game.get_visible_board()),
-        "winner": game.winner,
-        "turn": game.current_turn,
-        "message": f"{game.winner} wins!" if game.winner else ""
-    }
-    return jsonify(response)
+        response = board_payload(game)
+    return respond(game_id, response)
+
+# Same as /move, but answers as soon as the human move is made; the AI reply
+# is then fetched from /ai_move, which returns 202 while it is still running.
+@app.route("/move_async", methods=["POST"])
+def handle_move_async():
+    data = request.get_json()
+    row = int(data["row"])
+    col = int(data["col"])
+    game_id = current_game_id(data)
+
+    with store.session(game_id) as game:
+        if game.is_game_over():
+            return respond(game_id, {"error": "Game is already over."}, 400)
+        if ai_waiting(game):
+            return respond(game_id, {"error": "Waiting for the AI move."}, 409)
+
+        print(f"Human attempted move at: ({row}, {col})")
+
+        move_successful = game.make_move(row, col, HUMAN_PLAYER)
+        if not move_successful:
+            return respond(game_id, {"error": "Invalid move."}, 400)
+
+        response = board_payload(game)
+        if ai_waiting(game):
+            submit_search(game_id, game)  # If the pool is full, /ai_move retries
+            response["ai_pending"] = True
+    return respond(game_id, response)
+
+def submit_search(game_id, game):
+    if len(pending_moves) > 4 * search_pool.max_pending:
+        # Replies nobody fetched; /ai_move submits them again if asked.
+        for stale_id, (future, _) in list(pending_moves.items()):
+            if future.done():
+                pending_moves.pop(stale_id, None)
+    try:
+        pending_moves[game_id] = (search_pool.submit(ai, game), game.current_turn)
+    except SearchPoolFull:
+        pending_moves.pop(game_id, None)
+        return False
+    return True
+
+@app.route("/ai_move", methods=["GET", "POST"])
+def fetch_ai_move():
+    data = request.get_json(silent=True) if request.method == "POST" else request.args
+    game_id = current_game_id(data)
+
+    with store.session(game_id) as game:
+        if ai_waiting(game):
+            job = pending_moves.get(game_id)
+            if job is not None and job[1] != game.current_turn:
+                job = None
+            if job is None:
+                # The pool was full, or another worker took the move. Never
+                # search here: that is the overload the pool's limit is for.
+                if not submit_search(game_id, game):
+                    return respond(game_id, dict(board_payload(game), ai_pending=True), 503,
+                                   {"Retry-After": str(AI_RETRY_AFTER)})
+                job = pending_moves[game_id]
+            if not job[0].done():
+                return respond(game_id, dict(board_payload(game), ai_pending=True), 202)
+            pending_moves.pop(game_id, None)
+
+            ai_move = job[0].result()
+            if ai_move:
+                print(f"AI plays at: {ai_move}")
+                game.make_move(ai_move[0], ai_move[1], AI_PLAYER)
+
+        response = board_payload(game)
+    return respond(game_id, response)
 
 def convert_board_to_json_compatible(board):
     return [[list(cell) if cell else None for cell in row] for row in board]
 
 if __name__ == "__main__":
-    import os
     port = int(os.environ.get("PORT", 5000))
     app.run(host='0.0.0.0', port=port)
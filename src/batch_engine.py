@@ -0,0 +1,176 @@
+import numpy as np
+
+from ai_player import CELL_PRIORITY
+from game_engine import EMPTY_CELLS, FULL_MASK, MAX_MARKS, WIN_MASKS, WINNING_CELLS
+from solver import HEADER, NO_MOVE, NUM_SEQUENCES, SEQUENCE_INDEX, SEQUENCES
+from winrate import empty_stats
+
+# Many games stepped together: every array has one row per game, and since
+# all games start at once, every game in a step has the same side to move.
+
+POLICIES = ("greedy", "table")
+MAX_MOVES = 200
+BATCH_SIZE = 1 << 20
+
+LINES = np.array(WIN_MASKS, dtype=np.int32)
+CELL_BITS = (1 << np.arange(9)).astype(np.int32)
+WINNING_ARRAY = np.array(WINNING_CELLS, dtype=np.int32)  # Indexable by a column of masks
+EMPTY_COUNT = np.array([len(cells) for cells in EMPTY_CELLS], dtype=np.int32)
+# NTH_EMPTY[occupied, i]: the i-th empty cell in row-major order.
+NTH_EMPTY = np.zeros((FULL_MASK + 1, 9), dtype=np.int32)
+for _occupied, _cells in enumerate(EMPTY_CELLS):
+    NTH_EMPTY[_occupied, :len(_cells)] = _cells
+# FIRST_BY_PRIORITY[mask]: the set cell that comes first in CELL_PRIORITY.
+FIRST_BY_PRIORITY = np.zeros(FULL_MASK + 1, dtype=np.int32)
+for _mask in range(1, FULL_MASK + 1):
+    FIRST_BY_PRIORITY[_mask] = next(cell for cell in CELL_PRIORITY if _mask >> cell & 1)
+# SEQUENCE_OF[count, c0 * 81 + c1 * 9 + c2]: solver sequence number of a queue.
+SEQUENCE_OF = np.zeros((MAX_MARKS + 1, 729), dtype=np.int32)
+for _seq in SEQUENCES:
+    _padded = _seq + (0,) * (MAX_MARKS - len(_seq))
+    SEQUENCE_OF[len(_seq), _padded[0] * 81 + _padded[1] * 9 + _padded[2]] = SEQUENCE_INDEX[_seq]
+
+
+class BatchGames:
+    def __init__(self, n):
+        self.masks = np.zeros((n, 2), dtype=np.int32)
+        self.queues = np.zeros((n, 2, MAX_MARKS), dtype=np.int32)  # Oldest mark first
+        self.counts = np.zeros((n, 2), dtype=np.int32)
+        self.turn = 0
+        self.won = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.masks)
+
+    @property
+    def side(self):
+        return self.turn % 2
+
+    def occupied(self):
+        return self.masks[:, 0] | self.masks[:, 1]
+
+    def mask_after_move(self, p):
+        # Marks of player p that stay on the board through their next move.
+        full = self.counts[:, p] == MAX_MARKS
+        oldest = CELL_BITS[self.queues[:, p, 0]]
+        return self.masks[:, p] & ~np.where(full, oldest, 0)
+
+    def apply(self, cells):
+        # One move per game for the side to move; cells must be empty.
+        p = self.side
+        rows = np.arange(len(cells))
+        count = self.counts[:, p]
+        queue = self.queues[:, p]
+        full = count == MAX_MARKS
+
+        mask = self.mask_after_move(p) | CELL_BITS[cells]
+        shifted = np.concatenate([queue[:, 1:], cells[:, None]], axis=1)
+        queue[rows, np.minimum(count, MAX_MARKS - 1)] = cells
+        self.queues[:, p] = np.where(full[:, None], shifted, queue)
+        self.counts[:, p] = np.minimum(count + 1, MAX_MARKS)
+        self.masks[:, p] = mask
+
+        self.won = ((mask[:, None] & LINES) == LINES).any(axis=1)
+        self.turn += 1
+        return self.won
+
+    def keep(self, rows):
+        self.masks = self.masks[rows]
+        self.queues = self.queues[rows]
+        self.counts = self.counts[rows]
+        self.won = self.won[rows]
+
+    def state_indices(self):
+        # Index of each game in the solver's table, with the side to move.
+        codes = self.queues[:, :, 0] * 81 + self.queues[:, :, 1] * 9 + self.queues[:, :, 2]
+        x_seq = SEQUENCE_OF[self.counts[:, 0], codes[:, 0]]
+        o_seq = SEQUENCE_OF[self.counts[:, 1], codes[:, 1]]
+        return (x_seq * NUM_SEQUENCES + o_seq) * 2 + self.side
+
+
+def random_moves(games, rng):
+    occupied = games.occupied()
+    picks = (rng.random(len(games)) * EMPTY_COUNT[occupied]).astype(np.int32)
+    return NTH_EMPTY[occupied, picks]
+
+
+def greedy_moves(games):
+    # One-ply search: win if possible, else block, else center/corner/edge.
+    p = games.side
+    empty = ~games.occupied() & FULL_MASK
+    wins = WINNING_ARRAY[games.mask_after_move(p)] & empty
+    blocks = WINNING_ARRAY[games.mask_after_move(1 - p)] & empty
+    choice = np.where(wins != 0, wins, np.where(blocks != 0, blocks, empty))
+    return FIRST_BY_PRIORITY[choice]
+
+
+def table_moves(games, best):
+    moves = best[games.state_indices()].astype(np.int32)
+    unknown = moves == NO_MOVE
+    if unknown.any():
+        moves[unknown] = greedy_moves(games)[unknown]
+    return moves
+
+
+def solution_moves(solution):
+    # Best-move column of a solver.Solution, read straight from its mapping.
+    records = np.frombuffer(solution.data, dtype=np.dtype([("result", "u1"), ("best", "u1"), ("plies", "<u2")]),
+                            offset=HEADER.size)
+    return records["best"]
+
+
+def play_batch(n, rng, policy="greedy", best=None, max_moves=MAX_MOVES, first_index=0):
+    # Plays games first_index .. first_index + n - 1 of AI against random,
+    # the AI taking X in even-numbered games as winrate.py does. Returns the
+    # winner of each game (0 X, 1 O, -1 draw) and its length in moves.
+    ids = np.arange(n)
+    ai_side = (first_index + ids) % 2
+    winners = np.full(n, -1, dtype=np.int8)
+    lengths = np.full(n, max_moves, dtype=np.int32)
+    games = BatchGames(n)
+
+    while len(ids) and games.turn < max_moves:
+        p = games.side
+        moves = random_moves(games, rng)
+        ai_turn = ai_side[ids] == p
+        if ai_turn.any():
+            if policy == "table":
+                ai_moves = table_moves(games, best)
+            else:
+                ai_moves = greedy_moves(games)
+            moves = np.where(ai_turn, ai_moves, moves)
+
+        won = games.apply(moves)
+        if won.any():
+            finished = ids[won]
+            winners[finished] = p
+            lengths[finished] = games.turn
+            ongoing = ~won
+            ids = ids[ongoing]
+            games.keep(ongoing)
+
+    return winners, lengths, ai_side
+
+
+def simulate_batch(n=1000, seed=0, policy="greedy", solution=None, max_moves=MAX_MOVES,
+                   batch_size=BATCH_SIZE):
+    # Same stats layout as winrate.simulate_games, for winrate.report.
+    if policy == "table" and solution is None:
+        raise ValueError("The table policy needs a solver.Solution.")
+    best = solution_moves(solution) if policy == "table" else None
+    rng = np.random.default_rng(seed)
+    stats = empty_stats()
+
+    for start in range(0, n, batch_size):
+        count = min(batch_size, n - start)
+        winners, lengths, ai_side = play_batch(count, rng, policy, best, max_moves, start)
+        stats["games"] += count
+        stats["moves"] += int(lengths.sum())
+        for p, symbol in enumerate(("X", "O")):
+            games = ai_side == p
+            side = stats["by_side"][symbol]
+            side["games"] += int(games.sum())
+            side["ai_wins"] += int((games & (winners == p)).sum())
+            side["opponent_wins"] += int((games & (winners == 1 - p)).sum())
+            side["draws"] += int((games & (winners == -1)).sum())
+    return stats
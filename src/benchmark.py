@@ -0,0 +1,329 @@
+import argparse
+import contextlib
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import random
+import sys
+import time
+import tracemalloc
+
+import game_engine
+from ai_player import AIPlayer
+from game_engine import DisappearingTicTacToe
+from mcts_player import MCTSPlayer
+
+SUITES = ("engine", "ai", "sim", "http")
+CORPUS_SEED = 481
+CORPUS_SIZE = 40
+AI_DEPTHS = (3, 5, 7)
+REPEATS = 5
+MIN_RUN_SECONDS = 0.1
+
+# Every result has one headline number; "better" says which way is good so
+# comparisons against a baseline know what counts as a regression.
+
+
+def make_corpus(size=CORPUS_SIZE, seed=CORPUS_SEED):
+    # Fixed positions from random play, each with X to move and no winner.
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < size:
+        game = DisappearingTicTacToe()
+        for i in range(rng.randrange(0, 16, 2)):
+            game.make_move(*rng.choice(game.get_valid_moves()), "XO"[i % 2])
+            if game.is_game_over():
+                break
+        if not game.is_game_over():
+            corpus.append(game)
+    return corpus
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(seconds):
+    return {
+        "p50_ms": percentile(seconds, 0.50) * 1000,
+        "p90_ms": percentile(seconds, 0.90) * 1000,
+        "p99_ms": percentile(seconds, 0.99) * 1000,
+        "max_ms": max(seconds) * 1000,
+        "mean_ms": sum(seconds) / len(seconds) * 1000,
+    }
+
+
+def time_per_call(func, calls, repeat=REPEATS):
+    # Like timeit: grow the call count until one run takes MIN_RUN_SECONDS,
+    # then keep the best of several runs, since noise only ever adds time.
+    while True:
+        started = time.perf_counter_ns()
+        func(calls)
+        best = time.perf_counter_ns() - started
+        if best >= MIN_RUN_SECONDS * 1e9:
+            break
+        calls *= 2
+    for _ in range(repeat - 1):
+        started = time.perf_counter_ns()
+        func(calls)
+        best = min(best, time.perf_counter_ns() - started)
+    return best / calls
+
+
+def bench_engine(scale):
+    rng = random.Random(CORPUS_SEED)
+    games = []
+    for _ in range(200):
+        game = DisappearingTicTacToe()
+        moves = []
+        for i in range(30):
+            move = rng.choice(game.get_valid_moves())
+            if game.make_move(*move, "XO"[i % 2]) and game.is_game_over():
+                break
+            moves.append(move)
+        games.append(moves)
+    corpus = make_corpus()
+    boards = [game.get_visible_board() for game in corpus]
+    calls = 20000 * scale
+
+    def make_move(n):
+        game = DisappearingTicTacToe()
+        done = 0
+        while done < n:
+            for moves in games:
+                game.reset_game()
+                for i, (row, col) in enumerate(moves):
+                    game.make_move(row, col, "XO"[i % 2])
+                done += len(moves)
+
+    def reset_only(n):
+        game = DisappearingTicTacToe()
+        done = 0
+        while done < n:
+            for moves in games:
+                game.reset_game()
+                done += len(moves)
+
+    def loop(method):
+        def run(n):
+            for i in range(n):
+                method(corpus[i % len(corpus)])
+        return run
+
+    def check_win(n):
+        game = corpus[0]
+        for i in range(n):
+            game.check_win(boards[i % len(boards)], "X")
+
+    make_move_ns = time_per_call(make_move, calls) - time_per_call(reset_only, calls)
+    return {
+        "engine.make_move": {"value": make_move_ns, "unit": "ns/op", "better": "lower"},
+        "engine.get_valid_moves": {"value": time_per_call(loop(DisappearingTicTacToe.get_valid_moves), calls),
+                                   "unit": "ns/op", "better": "lower"},
+        "engine.get_visible_board": {"value": time_per_call(loop(DisappearingTicTacToe.get_visible_board), calls),
+                                     "unit": "ns/op", "better": "lower"},
+        "engine.check_win": {"value": time_per_call(check_win, calls), "unit": "ns/op", "better": "lower"},
+        "engine.place_unmake": {"value": time_per_call(loop(place_unmake), calls),
+                                "unit": "ns/op", "better": "lower"},
+    }
+
+
+def place_unmake(game):
+    game.place(game.valid_cells()[0], 0)
+    game.unmake_move()
+
+
+def bench_ai(scale):
+    corpus = make_corpus()
+    results = {}
+    for depth in AI_DEPTHS:
+        latencies = []
+        nodes = 0
+        for game in corpus[:max(5, len(corpus) * scale // 2)]:
+            ai = AIPlayer("X", max_depth=depth)
+            started = time.perf_counter()
+            ai.get_best_move(game)
+            latencies.append(time.perf_counter() - started)
+            nodes += ai.nodes_searched
+        total = sum(latencies)
+        results[f"ai.minimax_depth{depth}"] = dict(
+            latency_summary(latencies), value=percentile(latencies, 0.50) * 1000,
+            unit="ms p50", better="lower", nodes=nodes,
+            nodes_per_sec=nodes / total if total else 0.0)
+
+    latencies = []
+    iterations = 0
+    for i, game in enumerate(corpus[:10 * scale]):
+        ai = MCTSPlayer("X", iterations=500, seed=i)
+        started = time.perf_counter()
+        ai.get_best_move(game)
+        latencies.append(time.perf_counter() - started)
+        iterations += ai.total_iterations
+    results["ai.mcts_500"] = dict(
+        latency_summary(latencies), value=percentile(latencies, 0.50) * 1000,
+        unit="ms p50", better="lower", iterations_per_sec=iterations / sum(latencies))
+    return results
+
+
+def bench_sim(scale):
+    import batch_engine
+    import winrate
+
+    games = 200 * scale
+    started = time.perf_counter()
+    winrate.simulate_games(games, seed=CORPUS_SEED, workers=1, progress=False)
+    elapsed = time.perf_counter() - started
+    results = {"sim.serial_games": {"value": games / elapsed, "unit": "games/s", "better": "higher",
+                                    "games": games}}
+
+    games = 100000 * scale
+    started = time.perf_counter()
+    batch_engine.simulate_batch(games, seed=CORPUS_SEED)
+    elapsed = time.perf_counter() - started
+    results["sim.batch_games"] = {"value": games / elapsed, "unit": "games/s", "better": "higher",
+                                  "games": games}
+    return results
+
+
+def bench_http(scale):
+    import app as web
+
+    client = web.app.test_client()
+    table = getattr(web.ai, "table", None)
+    trees = getattr(web.ai, "trees", None)
+    work = "iterations" if web.AI_ENGINE == "mcts" else "nodes"
+    openings = [(row, col) for row in range(3) for col in range(3)]
+    latencies = []
+    searched = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(50 * scale):
+            client.post("/reset")
+            # Empty the AI's caches so each request times a search, not a
+            # reply remembered from the same opening earlier in the loop.
+            if table is not None:
+                table.clear()
+            if trees is not None:
+                trees.clear()
+            row, col = openings[i % len(openings)]
+            started = time.perf_counter()
+            response = client.post("/move", json={"row": row, "col": col})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"/move returned {response.status_code}")
+            searched += getattr(web.ai, "last_" + work)
+    return {"http.move": dict(latency_summary(latencies), value=percentile(latencies, 0.50) * 1000,
+                              unit="ms p50", better="lower", engine=web.AI_ENGINE,
+                              solution=web.solution is not None,
+                              **{work + "_per_move": searched / len(latencies)})}
+
+
+BENCHMARKS = {"engine": bench_engine, "ai": bench_ai, "sim": bench_sim, "http": bench_http}
+
+
+def run_suite(name, scale, profile=False, trace_alloc=False, count=False):
+    # Runs one suite, optionally under cProfile and/or tracemalloc, and with
+    # count adds the engine's move/copy counters for the whole suite to each
+    # result.
+    game_engine.reset_counters()
+    game_engine.count_calls(count)
+    profiler = cProfile.Profile() if profile else None
+    if trace_alloc:
+        tracemalloc.start()
+    if profiler:
+        profiler.enable()
+    try:
+        results = BENCHMARKS[name](scale)
+    finally:
+        game_engine.count_calls(False)
+        if profiler:
+            profiler.disable()
+        if trace_alloc:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    extra = {"engine_counters": dict(game_engine.counters)} if count else {}
+    if trace_alloc:
+        extra["alloc_peak_bytes"] = peak
+        extra["alloc_retained_bytes"] = current
+    for result in results.values():
+        result.update(extra)
+
+    if profiler:
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(25)
+        print(f"--- profile: {name} ---")
+        print(out.getvalue())
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Returns the names of benchmarks that got worse by more than tolerance.
+    regressions = []
+    for name, result in sorted(results.items()):
+        old = baseline.get("results", {}).get(name)
+        if old is None or not old.get("value"):
+            continue
+        change = (result["value"] - old["value"]) / old["value"]
+        worse = change > tolerance if result["better"] == "lower" else change < -tolerance
+        flag = "REGRESSION" if worse else ""
+        print(f"{name:28} {old['value']:12.3f} -> {result['value']:12.3f} {result['unit']:8} "
+              f"({change * 100:+.1f}%) {flag}")
+        if worse:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game engine, AI, simulator and HTTP paths.")
+    parser.add_argument("suites", nargs="*", help=f"suites to run: {', '.join(SUITES)} (default: all)")
+    parser.add_argument("--scale", type=int, default=1, help="multiply the amount of work per benchmark")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed slowdown against the baseline, as a fraction")
+    parser.add_argument("--profile", action="store_true", help="print cProfile stats for each suite")
+    parser.add_argument("--trace-alloc", action="store_true", help="record memory allocations with tracemalloc")
+    parser.add_argument("--count", action="store_true",
+                        help="count engine moves, unmakes and copies (slows the engine down)")
+    args = parser.parse_args()
+    unknown = [name for name in args.suites if name not in SUITES]
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(unknown)}")
+
+    results = {}
+    for name in args.suites or SUITES:
+        print(f"Running {name} benchmarks...")
+        results.update(run_suite(name, args.scale, args.profile, args.trace_alloc, args.count))
+
+    for name, result in sorted(results.items()):
+        print(f"{name:28} {result['value']:12.3f} {result['unit']}")
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "scale": args.scale,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
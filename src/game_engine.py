@@ -1,74 +1,263 @@
+import struct
+import sys
+
+PLAYERS = ("X", "O")
+PLAYER_INDEX = {"X": 0, "O": 1}
+MAX_MARKS = 3
+FULL_MASK = 0x1FF
+
+# Cell index is row * 3 + col; bit i of a mask is cell i.
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100,               # diagonals
+)
+CELL_WIN_MASKS = tuple(
+    tuple(line for line in WIN_MASKS if line >> cell & 1) for cell in range(9)
+)
+CELL_MOVES = tuple(divmod(cell, 3) for cell in range(9))
+# WINNING_CELLS[mask]: cells that would complete a line for a player holding mask.
+WINNING_CELLS = tuple(
+    sum(1 << cell for cell in range(9)
+        if any((mask | 1 << cell) & line == line for line in CELL_WIN_MASKS[cell]))
+    for mask in range(FULL_MASK + 1)
+)
+# Empty cells for every occupancy mask, in row-major order.
+EMPTY_CELLS = tuple(
+    tuple(cell for cell in range(9) if not occupied >> cell & 1)
+    for occupied in range(FULL_MASK + 1)
+)
+NO_CELL = 255
+# current_turn, winner index (-1 for none), then for each player's marks
+# oldest first: cell (NO_CELL if unused), turn placed, move number.
+STATE_FORMAT = struct.Struct("<Ib" + "BIB" * 2 * MAX_MARKS)
+
+# Work done by every game in this process while counting is on; see
+# count_calls(). benchmark.py turns it on with --count.
+counters = {"moves": 0, "unmakes": 0, "copies": 0}
+COUNTED_METHODS = {"place": "moves", "unmake_move": "unmakes", "copy": "copies"}
+
+
+def reset_counters():
+    for key in counters:
+        counters[key] = 0
+
+
 class DisappearingTicTacToe:
+    __slots__ = ("masks", "rings", "ring_heads", "ring_counts",
+                 "placed_turn", "move_numbers", "current_turn", "winner",
+                 "_undo")
+
     def __init__(self):
         self.reset_game()
 
     def reset_game(self):
-        self.board = [[None for _ in range(3)] for _ in range(3)]
+        self.masks = [0, 0]  # Occupancy per player, indexed like PLAYERS
+        self.rings = [[0] * MAX_MARKS, [0] * MAX_MARKS]  # Last squares, oldest at head
+        self.ring_heads = [0, 0]
+        self.ring_counts = [0, 0]
+        self.placed_turn = [0] * 9
+        self.move_numbers = [0] * 9
         self.current_turn = 0
         self.winner = None
-        self.move_history = {'X': [], 'O': []}  # Each entry: (row, col)
+        self._undo = []
+
+    def copy(self):
+        other = DisappearingTicTacToe.__new__(DisappearingTicTacToe)
+        other.masks = self.masks[:]
+        other.rings = [self.rings[0][:], self.rings[1][:]]
+        other.ring_heads = self.ring_heads[:]
+        other.ring_counts = self.ring_counts[:]
+        other.placed_turn = self.placed_turn[:]
+        other.move_numbers = self.move_numbers[:]
+        other.current_turn = self.current_turn
+        other.winner = self.winner
+        other._undo = self._undo[:]
+        return other
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def to_bytes(self):
+        # Compact snapshot of the position; the undo stack is not kept.
+        fields = [self.current_turn, PLAYER_INDEX[self.winner] if self.winner else -1]
+        for p in range(2):
+            cells = self.history_cells(p)
+            for i in range(MAX_MARKS):
+                if i < len(cells):
+                    fields += [cells[i], self.placed_turn[cells[i]], self.move_numbers[cells[i]]]
+                else:
+                    fields += [NO_CELL, 0, 0]
+        return STATE_FORMAT.pack(*fields)
+
+    @classmethod
+    def from_bytes(cls, data):
+        fields = STATE_FORMAT.unpack(data)
+        game = cls()
+        game.current_turn = fields[0]
+        game.winner = PLAYERS[fields[1]] if fields[1] >= 0 else None
+        offset = 2
+        for p in range(2):
+            for i in range(MAX_MARKS):
+                cell, turn, number = fields[offset:offset + 3]
+                offset += 3
+                if cell == NO_CELL:
+                    continue
+                game.rings[p][i] = cell
+                game.ring_counts[p] += 1
+                game.masks[p] |= 1 << cell
+                game.placed_turn[cell] = turn
+                game.move_numbers[cell] = number
+        return game
+
+    @property
+    def board(self):
+        return self.get_visible_board()
+
+    @property
+    def move_history(self):
+        return {player: [CELL_MOVES[cell] for cell in self.history_cells(p)]
+                for p, player in enumerate(PLAYERS)}
+
+    def history_cells(self, p):
+        ring = self.rings[p]
+        head = self.ring_heads[p]
+        return tuple(ring[(head + i) % MAX_MARKS] for i in range(self.ring_counts[p]))
 
     def count_player_moves(self, player):
-        return len(self.move_history[player])
+        return self.ring_counts[PLAYER_INDEX[player]]
 
     def make_move(self, row, col, player):
         if self.winner:
             return False
 
-        if (row, col) not in self.get_valid_moves():
+        if not (0 <= row < 3 and 0 <= col < 3) or (self.masks[0] | self.masks[1]) >> (row * 3 + col) & 1:
             print(f"Move invalid: not in valid_moves list.")
             return False
 
-        # Remove oldest if player already has 3 moves
-        if len(self.move_history[player]) >= 3:
-            old_row, old_col = self.move_history[player].pop(0)
-            self.board[old_row][old_col] = None
+        self.place(row * 3 + col, PLAYER_INDEX[player])
+        return True
 
-        move_number = len(self.move_history[player]) + 1
-        self.board[row][col] = [player, self.current_turn, move_number]
-        self.move_history[player].append((row, col))
+    def place(self, cell, p):
+        # Unchecked move for the search: cell must be empty and the game not over.
+        ring = self.rings[p]
+        mask = self.masks[p]
+        count = self.ring_counts[p]
 
-        visible_board = self.get_visible_board(self.current_turn)
-        if self.check_win(visible_board, player):
-            self.winner = player
+        # Remove oldest if player already has 3 moves
+        if count == MAX_MARKS:
+            head = self.ring_heads[p]
+            removed = ring[head]
+            self._undo.append((cell, p, removed, self.placed_turn[removed],
+                               self.move_numbers[removed]))
+            mask &= ~(1 << removed)
+            ring[head] = cell
+            self.ring_heads[p] = (head + 1) % MAX_MARKS
+        else:
+            self._undo.append((cell, p, -1, 0, 0))
+            ring[(self.ring_heads[p] + count) % MAX_MARKS] = cell
+            count += 1
+            self.ring_counts[p] = count
 
+        mask |= 1 << cell
+        self.masks[p] = mask
+        self.placed_turn[cell] = self.current_turn
+        self.move_numbers[cell] = count
         self.current_turn += 1
-        return True
+
+        if count == MAX_MARKS:
+            for line in CELL_WIN_MASKS[cell]:
+                if mask & line == line:
+                    self.winner = PLAYERS[p]
+                    return True
+        return False
+
+    def unmake_move(self):
+        cell, p, removed, removed_turn, removed_number = self._undo.pop()
+        mask = self.masks[p] & ~(1 << cell)
+
+        if removed < 0:
+            self.ring_counts[p] -= 1
+        else:
+            head = (self.ring_heads[p] - 1) % MAX_MARKS
+            self.rings[p][head] = removed
+            self.ring_heads[p] = head
+            mask |= 1 << removed
+            self.placed_turn[removed] = removed_turn
+            self.move_numbers[removed] = removed_number
+
+        self.masks[p] = mask
+        self.current_turn -= 1
+        self.winner = None
+        return CELL_MOVES[cell]
+
+    def mask_after_move(self, p):
+        # Player p's marks that stay on the board through their next move.
+        mask = self.masks[p]
+        if self.ring_counts[p] == MAX_MARKS:
+            mask &= ~(1 << self.rings[p][self.ring_heads[p]])
+        return mask
+
+    def clear_undo(self):
+        # Keeps the position but forgets how to unmake the moves that led to it.
+        self._undo.clear()
+
+    def undo_size(self):
+        # Approximate bytes held by the undo stack.
+        return sys.getsizeof(self._undo) + sum(sys.getsizeof(entry) for entry in self._undo)
+
+    def valid_cells(self):
+        if self.winner is not None:
+            return ()
+        return EMPTY_CELLS[self.masks[0] | self.masks[1]]
 
     def get_valid_moves(self):
-        moves = []
-        if self.winner is None:
-            for r in range(3):
-                for c in range(3):
-                    if self.board[r][c] is None:
-                        moves.append((r, c))
-        return moves
+        return [CELL_MOVES[cell] for cell in self.valid_cells()]
 
     def get_visible_board(self, turn_number=None):
-        if turn_number is None:
-            turn_number = self.current_turn
+        x_mask, o_mask = self.masks
+        placed_turn = self.placed_turn
+        move_numbers = self.move_numbers
+        visible_board = [[None, None, None], [None, None, None], [None, None, None]]
+        for cell in range(9):
+            if x_mask >> cell & 1:
+                visible_board[cell // 3][cell % 3] = ["X", placed_turn[cell], move_numbers[cell]]
+            elif o_mask >> cell & 1:
+                visible_board[cell // 3][cell % 3] = ["O", placed_turn[cell], move_numbers[cell]]
+        return visible_board
 
-        visible_board = [[None for _ in range(3)] for _ in range(3)]
+    def check_win(self, board, player):
+        mask = 0
         for r in range(3):
             for c in range(3):
-                cell = self.board[r][c]
-                if cell:
-                    player, turn_placed, move_number = cell
-                    visible_board[r][c] = [player, turn_placed, move_number]
-        return visible_board
+                if board[r][c] and board[r][c][0] == player:
+                    mask |= 1 << (r * 3 + c)
+        return self.has_line(mask)
 
-    def check_win(self, board, player):
-        for i in range(3):
-            if all(board[i][j] and board[i][j][0] == player for j in range(3)):
+    @staticmethod
+    def has_line(mask):
+        for line in WIN_MASKS:
+            if mask & line == line:
                 return True
-            if all(board[j][i] and board[j][i][0] == player for j in range(3)):
-                return True
-        if all(board[i][i] and board[i][i][0] == player for i in range(3)):
-            return True
-        if all(board[i][2 - i] and board[i][2 - i][0] == player for i in range(3)):
-            return True
         return False
 
     def is_game_over(self):
         return self.winner is not None
 
+
+UNCOUNTED_METHODS = {name: getattr(DisappearingTicTacToe, name) for name in COUNTED_METHODS}
+
+
+def counting(method, key):
+    def counted(*args):
+        counters[key] += 1
+        return method(*args)
+    return counted
+
+
+def count_calls(enabled=True):
+    # Swaps counting wrappers in for the hot methods, or the plain methods
+    # back, so games pay nothing for the counters unless asked to.
+    for name, key in COUNTED_METHODS.items():
+        method = UNCOUNTED_METHODS[name]
+        setattr(DisappearingTicTacToe, name, counting(method, key) if enabled else method)
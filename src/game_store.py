@@ -0,0 +1,413 @@
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from game_engine import STATE_FORMAT, DisappearingTicTacToe
+
+try:
+    import fcntl
+except ImportError:  # Windows: file locks only cover this process
+    fcntl = None
+
+GAME_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def new_game_id():
+    return uuid.uuid4().hex
+
+
+def is_valid_game_id(game_id):
+    return bool(game_id) and GAME_ID_PATTERN.match(game_id) is not None
+
+
+def game_size(game):
+    # Approximate bytes held by one in-memory game.
+    size = sys.getsizeof(game)
+    for value in (game.masks, game.ring_heads, game.ring_counts, game.placed_turn,
+                  game.move_numbers, game.rings[0], game.rings[1], game.rings):
+        size += sys.getsizeof(value)
+    return size + game.undo_size()
+
+
+class KeyedLocks:
+    # One lock per game ID, dropped again once nobody holds or waits on it.
+    def __init__(self):
+        self.guard = threading.Lock()
+        self.locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self.guard:
+            entry = self.locks.get(key)
+            if entry is None:
+                entry = self.locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.locks[key]
+
+
+class GameStore:
+    # Requests for one game run one at a time inside session(); requests for
+    # different games do not wait on each other.
+    def __init__(self):
+        self.locks = KeyedLocks()
+
+    @contextmanager
+    def session(self, game_id):
+        with self.locks.hold(game_id), self.locked(game_id):
+            game = self.load(game_id)
+            if game is None:
+                game = DisappearingTicTacToe()
+            yield game
+            self.save(game_id, game)
+
+    @contextmanager
+    def locked(self, game_id):
+        # Extra locking across processes, for stores that share state.
+        yield
+
+    def load(self, game_id):
+        raise NotImplementedError
+
+    def save(self, game_id, game):
+        raise NotImplementedError
+
+    def delete(self, game_id):
+        raise NotImplementedError
+
+    def active_games(self):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+
+class MemoryGameStore(GameStore):
+    # Games live in this process; the least recently used game is dropped
+    # past max_games, and games idle for longer than ttl seconds expire.
+    def __init__(self, max_games=10000, ttl=3600):
+        super().__init__()
+        self.max_games = max_games
+        self.ttl = ttl
+        self.games = OrderedDict()  # game_id -> (game, last used)
+        self.guard = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def expire(self, now):
+        while self.games:
+            game_id, (_, last_used) = next(iter(self.games.items()))
+            if now - last_used <= self.ttl:
+                break
+            del self.games[game_id]
+            self.expirations += 1
+
+    def load(self, game_id):
+        now = time.time()
+        with self.guard:
+            self.expire(now)
+            entry = self.games.get(game_id)
+            if entry is None:
+                return None
+            self.games[game_id] = (entry[0], now)
+            self.games.move_to_end(game_id)
+            return entry[0]
+
+    def save(self, game_id, game):
+        # Like to_bytes(), keep the position but not how to undo its moves,
+        # which would otherwise grow with every move of a long game.
+        game.clear_undo()
+        with self.guard:
+            self.games[game_id] = (game, time.time())
+            self.games.move_to_end(game_id)
+            while len(self.games) > self.max_games:
+                self.games.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, game_id):
+        with self.guard:
+            self.games.pop(game_id, None)
+
+    def active_games(self):
+        with self.guard:
+            self.expire(time.time())
+            return len(self.games)
+
+    def stats(self):
+        with self.guard:
+            self.expire(time.time())
+            sizes = [game_size(game) for game, _ in self.games.values()]
+        return {
+            "store": "memory",
+            "active_games": len(sizes),
+            "bytes_per_game": sum(sizes) / len(sizes) if sizes else 0,
+            "total_bytes": sum(sizes),
+            "max_games": self.max_games,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SerializedGameStore(GameStore):
+    # Keeps each game as DisappearingTicTacToe.to_bytes() in a backend that
+    # several server processes can share. Expired games are purged every
+    # purge_interval seconds, from whichever request comes along.
+    def __init__(self, backend, ttl=3600, purge_interval=300):
+        super().__init__()
+        self.backend = backend
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self.next_purge = time.time() + purge_interval
+        self.guard = threading.Lock()
+
+    @contextmanager
+    def session(self, game_id):
+        with super().session(game_id) as game:
+            yield game
+        self.purge_if_due()
+
+    @contextmanager
+    def locked(self, game_id):
+        with self.backend.locked(game_id):
+            yield
+
+    def load(self, game_id):
+        entry = self.backend.load(game_id)
+        if entry is None:
+            return None
+        data, updated = entry
+        if time.time() - updated > self.ttl:
+            return None  # Overwritten by save(), or removed by purge()
+        return DisappearingTicTacToe.from_bytes(data)
+
+    def save(self, game_id, game):
+        self.backend.save(game_id, game.to_bytes(), time.time())
+
+    def delete(self, game_id):
+        self.backend.delete(game_id)
+
+    def purge(self):
+        return self.backend.purge(time.time() - self.ttl)
+
+    def purge_if_due(self):
+        now = time.time()
+        with self.guard:
+            if now < self.next_purge:
+                return
+            self.next_purge = now + self.purge_interval
+        self.purge()
+
+    def active_games(self):
+        return self.backend.count(time.time() - self.ttl)
+
+    def stats(self):
+        return {
+            "store": self.backend.name,
+            "active_games": self.active_games(),
+            "bytes_per_game": STATE_FORMAT.size,
+            "total_bytes": self.backend.total_bytes(),
+            "ttl": self.ttl,
+        }
+
+
+class FileBackend:
+    # One file per game; an flock on a side file serializes requests for a
+    # game across processes.
+    name = "file"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, game_id, suffix=".game"):
+        return os.path.join(self.directory, game_id + suffix)
+
+    @contextmanager
+    def locked(self, game_id):
+        lock_file = self.lock(game_id, blocking=True)
+        try:
+            yield
+        finally:
+            if lock_file:
+                lock_file.close()  # Releases the flock
+
+    def lock(self, game_id, blocking):
+        # Returns the open lock file, or None if it is held and not blocking.
+        # Lock files are only removed by their holder (see purge), so a lock
+        # taken on a file that has since been unlinked is retried.
+        if fcntl is None:
+            return None
+        path = self.path(game_id, ".lock")
+        while True:
+            lock_file = open(path, "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+            try:
+                if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            lock_file.close()
+
+    def load(self, game_id):
+        path = self.path(game_id)
+        try:
+            with open(path, "rb") as f:
+                return f.read(), os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+    def save(self, game_id, data, updated):
+        path = self.path(game_id)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        os.utime(path, (updated, updated))
+
+    def delete(self, game_id):
+        # The lock file stays: a request may be holding it.
+        try:
+            os.remove(self.path(game_id))
+        except FileNotFoundError:
+            pass
+
+    def game_files(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.name.endswith(".game")]
+
+    def purge(self, older_than):
+        # Removes games last saved before older_than, along with their lock
+        # files and the lock files of games that were never saved. Games that
+        # a request holds right now are left for the next purge.
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            game_ids = {entry.name.rsplit(".", 1)[0] for entry in entries
+                        if entry.name.endswith((".game", ".lock"))}
+        for game_id in game_ids:
+            if not self.is_stale(game_id, older_than):
+                continue
+            lock_file = self.lock(game_id, blocking=False)
+            if fcntl is not None and lock_file is None:
+                continue
+            try:
+                if self.is_stale(game_id, older_than):
+                    if os.path.exists(self.path(game_id)):
+                        removed += 1
+                    self.delete(game_id)
+                    if lock_file:
+                        os.remove(self.path(game_id, ".lock"))
+            finally:
+                if lock_file:
+                    lock_file.close()
+        return removed
+
+    def is_stale(self, game_id, older_than):
+        try:
+            return os.path.getmtime(self.path(game_id)) < older_than
+        except FileNotFoundError:
+            return True
+
+    def count(self, newer_than):
+        return sum(1 for entry in self.game_files() if entry.stat().st_mtime >= newer_than)
+
+    def total_bytes(self):
+        return sum(entry.stat().st_size for entry in self.game_files())
+
+
+class SqliteBackend:
+    # All games in one table. A session holds a lease row for its game, so
+    # requests for one game wait on each other across processes while every
+    # SQL statement, and so SQLite's write lock, stays short.
+    name = "sqlite"
+    LEASE = 60  # Seconds before a lease left by a crashed process can be taken
+    POLL = 0.005
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        with self.connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS games "
+                       "(id TEXT PRIMARY KEY, state BLOB NOT NULL, updated REAL NOT NULL)")
+            db.execute("CREATE INDEX IF NOT EXISTS games_updated ON games (updated)")
+            db.execute("CREATE TABLE IF NOT EXISTS game_locks "
+                       "(id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+
+    def connection(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        return db
+
+    @contextmanager
+    def locked(self, game_id):
+        db = self.connection()
+        owner = uuid.uuid4().hex
+        while True:
+            now = time.time()
+            taken = db.execute(
+                "INSERT INTO game_locks (id, owner, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires "
+                "WHERE game_locks.expires < ?",
+                (game_id, owner, now + self.LEASE, now)).rowcount
+            if taken:
+                break
+            time.sleep(self.POLL)
+        try:
+            yield
+        finally:
+            db.execute("DELETE FROM game_locks WHERE id = ? AND owner = ?", (game_id, owner))
+
+    def load(self, game_id):
+        row = self.connection().execute(
+            "SELECT state, updated FROM games WHERE id = ?", (game_id,)).fetchone()
+        return (bytes(row[0]), row[1]) if row else None
+
+    def save(self, game_id, data, updated):
+        self.connection().execute(
+            "INSERT OR REPLACE INTO games (id, state, updated) VALUES (?, ?, ?)",
+            (game_id, data, updated))
+
+    def delete(self, game_id):
+        self.connection().execute("DELETE FROM games WHERE id = ?", (game_id,))
+
+    def purge(self, older_than):
+        db = self.connection()
+        db.execute("DELETE FROM game_locks WHERE expires < ?", (time.time(),))
+        return db.execute("DELETE FROM games WHERE updated < ?", (older_than,)).rowcount
+
+    def count(self, newer_than):
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM games WHERE updated >= ?", (newer_than,)).fetchone()[0]
+
+    def total_bytes(self):
+        return self.connection().execute(
+            "SELECT COALESCE(SUM(LENGTH(state)), 0) FROM games").fetchone()[0]
+
+
+def store_from_url(url, ttl=3600):
+    # "memory", "file:<directory>" or "sqlite:<path>".
+    kind, _, location = url.partition(":")
+    if kind == "memory":
+        return MemoryGameStore(ttl=ttl)
+    if kind == "file" and location:
+        return SerializedGameStore(FileBackend(location), ttl=ttl)
+    if kind == "sqlite" and location:
+        return SerializedGameStore(SqliteBackend(location), ttl=ttl)
+    raise ValueError(f"Unknown game store: {url!r}")
@@ -0,0 +1,167 @@
+import math
+import random
+import time
+from collections import OrderedDict
+
+from game_engine import CELL_MOVES, PLAYER_INDEX, WINNING_CELLS
+
+
+def state_key(game_state, to_move):
+    return game_state.history_cells(0), game_state.history_cells(1), to_move
+
+
+def winning_cell(game_state, p):
+    # A cell that wins on the spot for player p, or -1.
+    bits = WINNING_CELLS[game_state.mask_after_move(p)] & ~(game_state.masks[0] | game_state.masks[1])
+    return (bits & -bits).bit_length() - 1
+
+
+class Node:
+    __slots__ = ("parent", "move", "player", "children", "untried", "visits", "wins")
+
+    def __init__(self, parent, move, player, untried):
+        self.parent = parent
+        self.move = move      # Cell played to reach this node
+        self.player = player  # Index of the player who played it
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0       # From the point of view of self.player
+
+
+class MCTSPlayer:
+    # Monte Carlo Tree Search with UCT selection and random playouts that
+    # take an immediate win when one is on the board. Subtrees for the
+    # positions after each possible reply are kept, so the next call in the
+    # same game starts from the statistics already gathered.
+    def __init__(self, player_symbol, iterations=2000, time_limit=None,
+                 exploration=math.sqrt(2), rollout_limit=60, max_trees=256, seed=None):
+        if iterations is None and time_limit is None:
+            raise ValueError("MCTSPlayer needs an iteration or time limit")
+        self.player = player_symbol
+        self.opponent = "O" if player_symbol == "X" else "X"
+        self.index = PLAYER_INDEX[self.player]
+        self.opponent_index = PLAYER_INDEX[self.opponent]
+        self.iterations = iterations
+        self.time_limit = time_limit
+        self.exploration = exploration
+        self.rollout_limit = rollout_limit  # Playouts longer than this count as draws
+        self.max_trees = max_trees
+        self.trees = OrderedDict()  # state_key -> Node for the AI to move
+        self.rng = random.Random(seed)
+        self.last_iterations = 0
+        self.total_iterations = 0
+        self.reused_visits = 0
+
+    def get_best_move(self, game_state):
+        cells = game_state.valid_cells()
+        if not cells:
+            return None
+        cell = winning_cell(game_state, self.index)
+        if cell >= 0:
+            return CELL_MOVES[cell]
+
+        root = self.trees.pop(state_key(game_state, self.index), None)
+        if root is None:
+            root = Node(None, None, self.opponent_index, list(cells))
+        self.reused_visits = root.visits
+
+        self.search(game_state, root)
+        best = max(root.children, key=lambda child: child.visits)
+        self.keep_replies(game_state, best)
+        return CELL_MOVES[best.move]
+
+    def search(self, game_state, root):
+        deadline = None if self.time_limit is None else time.perf_counter() + self.time_limit
+        iterations = 0
+        while True:
+            self.iterate(game_state, root)
+            iterations += 1
+            if self.iterations is not None and iterations >= self.iterations:
+                break
+            if deadline is not None and iterations % 64 == 0 and time.perf_counter() >= deadline:
+                break
+        self.last_iterations = iterations
+        self.total_iterations += iterations
+
+    def iterate(self, game_state, root):
+        node = root
+        played = 0
+
+        # Selection
+        while not node.untried and node.children:
+            node = self.select_child(node)
+            game_state.place(node.move, node.player)
+            played += 1
+
+        # Expansion
+        if node.untried and game_state.winner is None:
+            cell = node.untried.pop(self.rng.randrange(len(node.untried)))
+            p = 1 - node.player
+            game_state.place(cell, p)
+            played += 1
+            child = Node(node, cell, p, list(game_state.valid_cells()))
+            node.children.append(child)
+            node = child
+
+        winner = self.rollout(game_state, 1 - node.player)
+
+        for _ in range(played):
+            game_state.unmake_move()
+
+        # Backpropagation
+        while node is not None:
+            node.visits += 1
+            if winner is None:
+                node.wins += 0.5
+            elif winner == node.player:
+                node.wins += 1
+            node = node.parent
+
+    def select_child(self, node):
+        log_visits = math.log(node.visits)
+        exploration = self.exploration
+        best = None
+        best_value = float('-inf')
+        for child in node.children:
+            value = child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits)
+            if value > best_value:
+                best_value = value
+                best = child
+        return best
+
+    def rollout(self, game_state, p):
+        rng = self.rng
+        played = 0
+        while game_state.winner is None and played < self.rollout_limit:
+            cell = winning_cell(game_state, p)
+            if cell < 0:
+                cell = rng.choice(game_state.valid_cells())
+            game_state.place(cell, p)
+            played += 1
+            p = 1 - p
+        winner = game_state.winner
+        for _ in range(played):
+            game_state.unmake_move()
+        return None if winner is None else PLAYER_INDEX[winner]
+
+    def keep_replies(self, game_state, best):
+        # Keep the subtree under each opponent reply to our move, keyed by
+        # the position it leads to; the rest of the old tree is dropped.
+        game_state.place(best.move, self.index)
+        if game_state.winner is None:
+            for reply in best.children:
+                game_state.place(reply.move, reply.player)
+                if game_state.winner is None:
+                    key = state_key(game_state, self.index)
+                    reply.parent = None
+                    self.trees.pop(key, None)
+                    self.trees[key] = reply
+                game_state.unmake_move()
+        game_state.unmake_move()
+
+        while len(self.trees) > self.max_trees:
+            try:
+                self.trees.popitem(last=False)
+            except KeyError:
+                break
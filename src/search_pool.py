@@ -0,0 +1,44 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SearchPoolFull(Exception):
+    pass
+
+
+class SearchPool:
+    # Runs AI searches off the request threads. At most max_pending searches
+    # may be queued or running; past that submit() raises SearchPoolFull
+    # instead of letting the queue, and the wait for a reply, grow.
+    def __init__(self, max_workers=2, max_pending=32):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-search")
+        self.max_pending = max_pending
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.pending = 0
+        self.guard = threading.Lock()
+        self.rejected = 0
+
+    def submit(self, ai, game_state):
+        # Searches a copy, so the caller may keep changing its own game.
+        if not self.slots.acquire(blocking=False):
+            with self.guard:
+                self.rejected += 1
+            raise SearchPoolFull("Too many AI moves are already waiting.")
+        with self.guard:
+            self.pending += 1
+        future = self.executor.submit(ai.get_best_move, game_state.copy())
+        future.add_done_callback(self.release)
+        return future
+
+    def release(self, future):
+        with self.guard:
+            self.pending -= 1
+        self.slots.release()
+
+    def stats(self):
+        with self.guard:
+            return {"pending": self.pending, "max_pending": self.max_pending,
+                    "rejected": self.rejected}
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,211 @@
+import argparse
+import mmap
+import os
+import struct
+import time
+from itertools import permutations
+
+from game_engine import CELL_MOVES, MAX_MARKS, WIN_MASKS
+
+# A state is each player's marks in disappearance order (oldest first) plus
+# the side to move. Every ordered sequence of up to 3 distinct cells gets a
+# number, which gives a collision-free array index for the whole state space.
+SEQUENCES = [seq for n in range(MAX_MARKS + 1) for seq in permutations(range(9), n)]
+SEQUENCE_INDEX = {seq: i for i, seq in enumerate(SEQUENCES)}
+NUM_SEQUENCES = len(SEQUENCES)
+NUM_STATES = NUM_SEQUENCES * NUM_SEQUENCES * 2
+
+SEQUENCE_MASKS = [sum(1 << cell for cell in seq) for seq in SEQUENCES]
+# NEXT_SEQUENCE[i][cell]: the sequence after playing cell, or -1 if occupied.
+NEXT_SEQUENCE = []
+WINNING_MOVE = []
+PREVIOUS_SEQUENCES = [[] for _ in SEQUENCES]  # (previous sequence, cell played)
+for _i, _seq in enumerate(SEQUENCES):
+    _next = [-1] * 9
+    _wins = [False] * 9
+    for _cell in range(9):
+        if _cell in _seq:
+            continue
+        _after = (_seq[1:] if len(_seq) == MAX_MARKS else _seq) + (_cell,)
+        _mask = SEQUENCE_MASKS[SEQUENCE_INDEX[_after]]
+        _next[_cell] = SEQUENCE_INDEX[_after]
+        _wins[_cell] = any(_mask & line == line for line in WIN_MASKS)
+        PREVIOUS_SEQUENCES[_next[_cell]].append((_i, _cell))
+    NEXT_SEQUENCE.append(_next)
+    WINNING_MOVE.append(_wins)
+
+UNKNOWN, WIN, LOSS, DRAW = 0, 1, 2, 3  # Seen by the side to move
+RESULT_NAMES = ("unknown", "win", "loss", "draw")
+NO_MOVE = 255
+
+MAGIC = b"DTTT"
+VERSION = 1
+HEADER = struct.Struct("<4sHI")
+RECORD = struct.Struct("<BBH")  # result, best cell, plies to the end
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfect_play.bin")
+
+
+def state_index(x_seq, o_seq, side):
+    return (x_seq * NUM_SEQUENCES + o_seq) * 2 + side
+
+
+def split_index(index):
+    pair, side = divmod(index, 2)
+    x_seq, o_seq = divmod(pair, NUM_SEQUENCES)
+    return x_seq, o_seq, side
+
+
+def game_state_index(game_state, side):
+    return state_index(SEQUENCE_INDEX[game_state.history_cells(0)],
+                       SEQUENCE_INDEX[game_state.history_cells(1)], side)
+
+
+def children(index):
+    # Yields (cell, child index or -1 for a winning move).
+    x_seq, o_seq, side = split_index(index)
+    occupied = SEQUENCE_MASKS[x_seq] | SEQUENCE_MASKS[o_seq]
+    mover = o_seq if side else x_seq
+    for cell in range(9):
+        if occupied >> cell & 1:
+            continue
+        if WINNING_MOVE[mover][cell]:
+            yield cell, -1
+        elif side:
+            yield cell, state_index(x_seq, NEXT_SEQUENCE[o_seq][cell], 0)
+        else:
+            yield cell, state_index(NEXT_SEQUENCE[x_seq][cell], o_seq, 1)
+
+
+def parents(index):
+    # Yields (parent index, cell played) for every way to reach this state.
+    x_seq, o_seq, side = split_index(index)
+    if side:
+        other = SEQUENCE_MASKS[o_seq]
+        for previous, cell in PREVIOUS_SEQUENCES[x_seq]:
+            if not SEQUENCE_MASKS[previous] & other:
+                yield state_index(previous, o_seq, 0), cell
+    else:
+        other = SEQUENCE_MASKS[x_seq]
+        for previous, cell in PREVIOUS_SEQUENCES[o_seq]:
+            if not SEQUENCE_MASKS[previous] & other:
+                yield state_index(x_seq, previous, 1), cell
+
+
+def solve():
+    # Forward pass: every position reachable from reset_game with X to move.
+    reachable = bytearray(NUM_STATES)
+    start = state_index(0, 0, 0)
+    reachable[start] = 1
+    order = [start]
+    for index in order:
+        for cell, child in children(index):
+            if child >= 0 and not reachable[child]:
+                reachable[child] = 1
+                order.append(child)
+
+    results = bytearray(NUM_STATES)
+    best = bytearray([NO_MOVE]) * NUM_STATES
+    distance = [0] * NUM_STATES
+    unresolved = [0] * NUM_STATES
+
+    queue = []
+    for index in order:
+        count = 0
+        for cell, child in children(index):
+            if child < 0:
+                results[index] = WIN
+                best[index] = cell
+                distance[index] = 1
+                queue.append(index)
+                break
+            count += 1
+        unresolved[index] = count
+
+    # Backward pass in order of distance: a parent wins by moving into any
+    # lost position, and loses once every move leads to a won position.
+    for index in queue:
+        lost = results[index] == LOSS
+        for parent, cell in parents(index):
+            if not reachable[parent] or results[parent]:
+                continue
+            if lost:
+                results[parent] = WIN
+            else:
+                unresolved[parent] -= 1
+                if unresolved[parent]:
+                    continue
+                results[parent] = LOSS
+            best[parent] = cell
+            distance[parent] = distance[index] + 1
+            queue.append(parent)
+
+    # Whatever is left can never be forced either way: a draw by cycling.
+    for index in order:
+        if results[index]:
+            continue
+        results[index] = DRAW
+        for cell, child in children(index):
+            if child >= 0 and results[child] in (DRAW, UNKNOWN):
+                best[index] = cell
+                break
+
+    return results, best, distance, len(order)
+
+
+def write_solution(path, results, best, distance):
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, NUM_STATES))
+        records = bytearray(RECORD.size * NUM_STATES)
+        for index in range(NUM_STATES):
+            RECORD.pack_into(records, index * RECORD.size,
+                             results[index], best[index], min(distance[index], 0xFFFF))
+        f.write(records)
+
+
+class Solution:
+    # Read-only view of a solved table; the file is memory-mapped so several
+    # server workers share one copy of it.
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, num_states = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION or num_states != NUM_STATES:
+            self.data.close()
+            raise ValueError(f"{path} is not a version {VERSION} solution file.")
+
+    def close(self):
+        self.data.close()
+
+    def lookup(self, game_state, side):
+        # Returns (result, best cell, distance), or None if the position
+        # cannot come up in a game started from reset_game.
+        index = game_state_index(game_state, side)
+        result, cell, plies = RECORD.unpack_from(self.data, HEADER.size + index * RECORD.size)
+        if result == UNKNOWN:
+            return None
+        return result, cell, plies
+
+    def best_move(self, game_state, side):
+        entry = self.lookup(game_state, side)
+        if entry is None or entry[1] == NO_MOVE:
+            return None
+        return CELL_MOVES[entry[1]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve Disappearing Tic-Tac-Toe by retrograde analysis.")
+    parser.add_argument("--output", default=DEFAULT_PATH, help="where to write the solution file")
+    args = parser.parse_args()
+
+    started = time.time()
+    results, best, distance, reachable = solve()
+    write_solution(args.output, results, best, distance)
+
+    print(f"Reachable positions: {reachable}")
+    print(f"Wins: {results.count(WIN)}  Losses: {results.count(LOSS)}  Draws: {results.count(DRAW)}")
+    print(f"Opening position: {RESULT_NAMES[results[state_index(0, 0, 0)]]} for X")
+    print(f"Wrote {args.output} in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
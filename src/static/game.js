@@ -44,7 +44,7 @@ function attachCellListeners() {
             const row = cell.dataset.row;
             const col = cell.dataset.col;
 
-            fetch("/move", {
+            fetch("/move_async", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({ row, col })
@@ -55,23 +55,58 @@ function attachCellListeners() {
                     alert(data.error);
                     return;
                 }
-                updateBoard(data.board, data.turn);
-                if (data.winner) {
-                    if (data.winner === "X") {
-                        statusElement.textContent = "You Win!";
-                    } else if (data.winner === "O") {
-                        statusElement.textContent = "Cat win!";
-                    } else {
-                        statusElement.textContent = `${data.winner} wins!`;
-                    }
-                } else {
-                    statusElement.textContent = "";
+                showResult(data);
+                if (data.ai_pending) {
+                    fetchAiMove();
                 }
             });
         });
     });
 }
 
+// The server answers the human move at once; poll until the AI has replied.
+// A 503 means every AI worker is busy: wait as long as Retry-After says.
+function fetchAiMove() {
+    fetch("/ai_move")
+        .then(res => {
+            if (res.status === 202) {
+                setTimeout(fetchAiMove, 100);
+                return null;
+            }
+            if (res.status === 503) {
+                const seconds = parseFloat(res.headers.get("Retry-After")) || 1;
+                setTimeout(fetchAiMove, seconds * 1000);
+                return null;
+            }
+            return res.json();
+        })
+        .then(data => {
+            if (!data) {
+                return;
+            }
+            if (data.error) {
+                alert(data.error);
+                return;
+            }
+            showResult(data);
+        });
+}
+
+function showResult(data) {
+    updateBoard(data.board, data.turn);
+    if (data.winner) {
+        if (data.winner === "X") {
+            statusElement.textContent = "You Win!";
+        } else if (data.winner === "O") {
+            statusElement.textContent = "Cat win!";
+        } else {
+            statusElement.textContent = `${data.winner} wins!`;
+        }
+    } else {
+        statusElement.textContent = "";
+    }
+}
+
 function resetGame() {
     fetch("/reset", { method: "POST" })
         .then(() => {
@@ -0,0 +1,123 @@
+import random
+from collections import OrderedDict
+
+from game_engine import MAX_MARKS
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+def _cell_map(transform):
+    return tuple(transform(r, c)[0] * 3 + transform(r, c)[1] for r in range(3) for c in range(3))
+
+
+# The 8 symmetries of the board as cell permutations: SYMMETRIES[t][cell] is
+# where cell lands under transform t.
+SYMMETRIES = tuple(_cell_map(f) for f in (
+    lambda r, c: (r, c),
+    lambda r, c: (c, 2 - r),
+    lambda r, c: (2 - r, 2 - c),
+    lambda r, c: (2 - c, r),
+    lambda r, c: (r, 2 - c),
+    lambda r, c: (2 - r, c),
+    lambda r, c: (c, r),
+    lambda r, c: (2 - c, 2 - r),
+))
+INVERSE_SYMMETRIES = tuple(
+    tuple(sym.index(cell) for cell in range(9)) for sym in SYMMETRIES
+)
+
+# One random key per (player, age, cell); age 0 is the player's newest mark,
+# so the keys also capture the order in which marks will disappear.
+_rng = random.Random(481)
+ZOBRIST = tuple(
+    tuple(tuple(_rng.getrandbits(64) for _ in range(9)) for _ in range(MAX_MARKS))
+    for _ in range(2)
+)
+SIDE_KEY = _rng.getrandbits(64)
+ZOBRIST_BY_SYMMETRY = tuple(
+    tuple(tuple(tuple(ZOBRIST[p][age][sym[cell]] for cell in range(9))
+                for age in range(MAX_MARKS))
+          for p in range(2))
+    for sym in SYMMETRIES
+)
+
+
+def canonical_key(game_state, to_move):
+    # Smallest hash over the 8 symmetric images, and the transform giving it.
+    histories = (game_state.history_cells(0), game_state.history_cells(1))
+    side = SIDE_KEY if to_move else 0
+    best_key = None
+    best_transform = 0
+    for t, keys in enumerate(ZOBRIST_BY_SYMMETRY):
+        key = side
+        for p in (0, 1):
+            ages = keys[p]
+            cells = histories[p]
+            newest = len(cells) - 1
+            for i, cell in enumerate(cells):
+                key ^= ages[newest - i][cell]
+        if best_key is None or key < best_key:
+            best_key = key
+            best_transform = t
+    return best_key, best_transform
+
+
+class TranspositionTable:
+    # Entries are (depth, bound, score, move) with the score seen by the side
+    # to move and the move in the canonical frame; least recently used
+    # entries are evicted once max_entries is reached. Searches on several
+    # threads may share a table: an entry evicted by another thread between
+    # two steps below is simply treated as gone.
+    def __init__(self, max_entries=1 << 20):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def probe(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            self.entries.move_to_end(key)
+        except KeyError:
+            pass
+        return entry
+
+    def store(self, key, depth, bound, score, move):
+        old = self.entries.get(key)
+        if old is not None:
+            if old[0] > depth:
+                return
+        elif len(self.entries) >= self.max_entries:
+            try:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            except KeyError:
+                pass
+        self.entries.pop(key, None)  # Re-inserting moves the key to the end
+        self.entries[key] = (depth, bound, score, move)
+        self.stores += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = self.stores = self.evictions = 0
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / probes if probes else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
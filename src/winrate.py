@@ -1,48 +1,215 @@
+import argparse
+import math
+import os
 import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from ai_player import AIPlayer
 from game_engine import DisappearingTicTacToe
-from copy import deepcopy
+from mcts_player import MCTSPlayer
+
+ENGINES = ("minimax", "mcts")
+OPPONENTS = ("random", "ai", "mcts")
+MAX_MOVES = 200  # A game still going after this many moves counts as a draw
+# Minimax never draws on the game's random stream, so minimax against minimax
+# would replay one game per side; random first moves make the games differ.
+AI_OPENING_PLIES = 4
+CHUNK_SIZE = 500
+
+
+def random_move(game, rng=random):
+    return rng.choice(game.get_valid_moves())
+
+
+def game_rng(seed, index):
+    # Each game gets its own stream, so results do not depend on which
+    # worker plays it or in what order.
+    return random.Random(f"{seed}:{index}")
+
 
-def random_move(game):
-    return random.choice(game.get_valid_moves())
+def make_ai(engine, symbol, rng, depth=3, iterations=1000):
+    if engine == "mcts":
+        return MCTSPlayer(symbol, iterations=iterations, seed=rng.getrandbits(64))
+    return AIPlayer(symbol, max_depth=depth)
 
-def play_game(ai_symbol):
+
+def play_game(ai_symbol, rng=random, opponent="random", depth=3,
+              opponent_depth=3, max_moves=MAX_MOVES, engine="minimax", iterations=1000,
+              opening_plies=0):
     game = DisappearingTicTacToe()
-    ai = AIPlayer(ai_symbol)
-    opponent = "O" if ai_symbol == "X" else "X"
+    ai = make_ai(engine, ai_symbol, rng, depth, iterations)
+    opponent_symbol = "O" if ai_symbol == "X" else "X"
+    opponent_ai = None
+    if opponent == "ai":
+        opponent_ai = make_ai("minimax", opponent_symbol, rng, opponent_depth)
+    elif opponent == "mcts":
+        opponent_ai = make_ai("mcts", opponent_symbol, rng, iterations=iterations)
     current = "X"
 
-    while not game.is_game_over() and game.get_valid_moves():
-        if current == ai.player:
-            move = ai.get_best_move(deepcopy(game))
+    while not game.is_game_over() and game.current_turn < max_moves:
+        if game.current_turn < opening_plies:
+            move = random_move(game, rng)
+        elif current == ai.player:
+            move = ai.get_best_move(game)
+        elif opponent_ai is not None:
+            move = opponent_ai.get_best_move(game)
         else:
-            move = random_move(game)
+            move = random_move(game, rng)
         game.make_move(move[0], move[1], current)
-        current = opponent if current == ai_symbol else ai_symbol
+        current = opponent_symbol if current == ai_symbol else ai_symbol
 
-    return game.winner
+    return game.winner, game.current_turn
 
-def simulate_games(n=1000):
-    ai_wins = 0
-    random_wins = 0
-    draws = 0
 
-    for i in range(n):
-        ai_symbol = "X" if i % 2 == 0 else "O"
-        winner = play_game(ai_symbol)
+def empty_stats():
+    return {
+        "games": 0,
+        "moves": 0,
+        "by_side": {side: {"games": 0, "ai_wins": 0, "opponent_wins": 0, "draws": 0}
+                    for side in ("X", "O")},
+    }
+
 
+def merge_stats(total, part):
+    total["games"] += part["games"]
+    total["moves"] += part["moves"]
+    for side, counts in part["by_side"].items():
+        for key, value in counts.items():
+            total["by_side"][side][key] += value
+    return total
+
+
+def play_chunk(start, stop, seed, opponent, depth, opponent_depth, max_moves,
+               engine, iterations, opening_plies=0):
+    stats = empty_stats()
+    for i in range(start, stop):
+        ai_symbol = "X" if i % 2 == 0 else "O"
+        winner, moves = play_game(ai_symbol, game_rng(seed, i), opponent, depth,
+                                  opponent_depth, max_moves, engine, iterations, opening_plies)
+        side = stats["by_side"][ai_symbol]
+        side["games"] += 1
         if winner == ai_symbol:
-            ai_wins += 1
+            side["ai_wins"] += 1
         elif winner is None:
-            draws += 1
+            side["draws"] += 1
         else:
-            random_wins += 1
+            side["opponent_wins"] += 1
+        stats["games"] += 1
+        stats["moves"] += moves
+    return stats
+
+
+def simulate_games(n=1000, seed=0, workers=1, opponent="random", depth=3,
+                   opponent_depth=3, max_moves=MAX_MOVES, chunk_size=CHUNK_SIZE,
+                   progress=True, engine="minimax", iterations=1000, opening_plies=0):
+    chunks = [(start, min(start + chunk_size, n)) for start in range(0, n, chunk_size)]
+    args = (seed, opponent, depth, opponent_depth, max_moves, engine, iterations, opening_plies)
+    stats = empty_stats()
+
+    if workers <= 1:
+        for start, stop in chunks:
+            merge_stats(stats, play_chunk(start, stop, *args))
+            if progress:
+                print(f"{stats['games']} games completed...")
+        return stats
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, start, stop, *args) for start, stop in chunks]
+        for future in as_completed(futures):
+            merge_stats(stats, future.result())
+            if progress:
+                print(f"{stats['games']} games completed...")
+    return stats
+
+
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    denominator = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denominator
+    half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    # Rounding can push a bound just past 0 or 1 when p is 0 or 1.
+    return max(0.0, centre - half_width), min(1.0, centre + half_width)
+
+
+def report(stats, deterministic=False):
+    n = stats["games"]
+    if n == 0:
+        print("No games played.")
+        return
+    totals = {key: sum(side[key] for side in stats["by_side"].values())
+              for key in ("ai_wins", "opponent_wins", "draws")}
+    low, high = wilson_interval(totals["ai_wins"], n)
+
+    print(f"AI Wins:        {totals['ai_wins']} ({totals['ai_wins'] / n * 100:.2f}%)")
+    print(f"Opponent Wins:  {totals['opponent_wins']} ({totals['opponent_wins'] / n * 100:.2f}%)")
+    print(f"Draws:          {totals['draws']} ({totals['draws'] / n * 100:.2f}%)")
+    if deterministic:
+        print("AI win rate 95% CI: n/a (every game with the same AI side is the same game)")
+    else:
+        print(f"AI win rate 95% CI: [{low * 100:.2f}%, {high * 100:.2f}%]")
+    print(f"Average game length: {stats['moves'] / n:.2f} moves")
+    for symbol, side in stats["by_side"].items():
+        if side["games"]:
+            print(f"  AI as {symbol}: {side['ai_wins']} wins, {side['opponent_wins']} losses, "
+                  f"{side['draws']} draws in {side['games']} games")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play the AI against an opponent and report its win rate.")
+    parser.add_argument("-n", "--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--opponent", choices=OPPONENTS, default="random")
+    parser.add_argument("--engine", choices=ENGINES, default="minimax", help="engine of the AI under test")
+    parser.add_argument("--depth", type=int, default=None, help="search depth of the AI under test (default 3)")
+    parser.add_argument("--iterations", type=int, default=None, help="MCTS playouts per move (default 1000)")
+    parser.add_argument("--opponent-depth", type=int, default=3, help="search depth of an ai opponent")
+    parser.add_argument("--max-moves", type=int, default=MAX_MOVES)
+    parser.add_argument("--opening-plies", type=int, default=None,
+                        help="random moves that open each game (default: "
+                             f"{AI_OPENING_PLIES} for minimax against --opponent ai, else 0)")
+    parser.add_argument("--quiet", action="store_true", help="do not print progress")
+    parser.add_argument("--batch", action="store_true",
+                        help="step all games together with NumPy (random opponent only)")
+    parser.add_argument("--policy", choices=("greedy", "table"), default="greedy",
+                        help="AI policy for --batch: one-ply greedy or the solver table")
+    parser.add_argument("--solution", default=None, help="solution file for --policy table")
+    args = parser.parse_args()
+    if args.batch:
+        # The batch engine plays its own --policy, not a search engine.
+        if args.opponent != "random":
+            parser.error("--batch only plays against the random opponent")
+        if args.engine != "minimax":
+            parser.error("--batch plays --policy, not --engine mcts")
+        for option in ("depth", "iterations", "opening_plies"):
+            if getattr(args, option) is not None:
+                parser.error(f"--{option.replace('_', '-')} does not apply to --batch")
+    depth = 3 if args.depth is None else args.depth
+    iterations = 1000 if args.iterations is None else args.iterations
+
+    opening_plies = args.opening_plies
+    both_minimax = args.engine == "minimax" and args.opponent == "ai"
+    if opening_plies is None:
+        opening_plies = AI_OPENING_PLIES if both_minimax else 0
 
-        if (i + 1) % 100 == 0:
-            print(f"{i+1} games completed...")
+    started = time.time()
+    if args.batch:
+        from batch_engine import simulate_batch
+        from solver import DEFAULT_PATH, Solution
+        solution = Solution(args.solution or DEFAULT_PATH) if args.policy == "table" else None
+        stats = simulate_batch(args.games, args.seed, args.policy, solution, args.max_moves)
+    else:
+        stats = simulate_games(args.games, args.seed, args.workers, args.opponent, depth,
+                               args.opponent_depth, args.max_moves, progress=not args.quiet,
+                               engine=args.engine, iterations=iterations,
+                               opening_plies=opening_plies)
+    elapsed = time.time() - started
+    report(stats, deterministic=both_minimax and not args.batch and opening_plies == 0)
+    print(f"Played in {elapsed:.2f}s ({args.games / max(elapsed, 1e-9):.0f} games/s)")
 
-    print(f"AI Wins:      {ai_wins} ({ai_wins / n * 100:.2f}%)")
-    print(f"Random Wins:  {random_wins} ({random_wins / n * 100:.2f}%)")
-    print(f"Draws:        {draws} ({draws / n * 100:.2f}%)")
 
-simulate_games(1000)
+if __name__ == "__main__":
+    main()